@@ -1,121 +1,523 @@
+import atexit
+import ctypes
+import gzip
 import json
-import hashlib
+import orjson
+import os
 import pyperclip
+import select
+import sys
 import threading
 import time
+import xxhash
 
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 
-JSON_FILE = 'clipboard_history.json'
+JSON_FILE = 'clipboard_history.jsonl'
+LEGACY_JSON_FILE = 'clipboard_history.json'  # Single JSON array, before the switch to JSONL
 TXT_FILE = 'clipboard_history.txt'
+URL_PREFIX = 'https://'
+JSON_SEPARATORS = (',', ':')  # Compact output, no spaces
+FLUSH_BATCH_SIZE = 16  # Entries buffered before a forced flush
+FLUSH_INTERVAL = 5.0  # Seconds before buffered entries are flushed
+POLL_INTERVAL = 0.5  # Seconds between change-counter checks
+FALLBACK_POLL_INTERVAL = 1.0  # Seconds between full clipboard reads
+X11_TIMEOUT = 1.0  # Seconds to wait for the clipboard owner to answer
+
+try:
+    from AppKit import NSPasteboard
+except ImportError:
+    NSPasteboard = None
+
+
+def write_atomic(path, data):
+    # Write to a temporary file and swap it in, so an interrupted write
+    # leaves the previous file intact
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def format_hash(content_hash):
+    # Hashes are kept as ints in memory and as fixed-width hex on disk
+    return f'{content_hash:016x}'
+
+
+def upgrade_hash(entry):
+    # Entries written before the switch to XXH3 carry a 32-char MD5 digest;
+    # rehash them so dedup still works
+    if len(entry.get('hash', '')) != 16:
+        entry['hash'] = format_hash(xxhash.xxh3_64_intdigest(entry['content'].encode()))
+    return entry
+
+
+class Win32ClipboardListener:
+    # Receives WM_CLIPBOARDUPDATE on a hidden message-only window
+    WM_CLIPBOARDUPDATE = 0x031D
+    HWND_MESSAGE = -3
+
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self.active = False
+
+    def start(self):
+        # The window has to be created on the thread that pumps its messages
+        ready = threading.Event()
+        threading.Thread(target=self.run, args=(ready,), daemon=True).start()
+        ready.wait()
+        return self.active
+
+    def run(self, ready):
+        try:
+            from ctypes import wintypes
+
+            user32 = ctypes.WinDLL('user32')
+            kernel32 = ctypes.WinDLL('kernel32')
+            LRESULT = ctypes.c_ssize_t
+            WNDPROC = ctypes.WINFUNCTYPE(LRESULT, wintypes.HWND, wintypes.UINT,
+                                         wintypes.WPARAM, wintypes.LPARAM)
+
+            class WNDCLASS(ctypes.Structure):
+                _fields_ = [('style', wintypes.UINT),
+                            ('lpfnWndProc', WNDPROC),
+                            ('cbClsExtra', ctypes.c_int),
+                            ('cbWndExtra', ctypes.c_int),
+                            ('hInstance', wintypes.HINSTANCE),
+                            ('hIcon', wintypes.HICON),
+                            ('hCursor', wintypes.HANDLE),
+                            ('hbrBackground', wintypes.HBRUSH),
+                            ('lpszMenuName', wintypes.LPCWSTR),
+                            ('lpszClassName', wintypes.LPCWSTR)]
+
+            user32.DefWindowProcW.argtypes = [wintypes.HWND, wintypes.UINT,
+                                              wintypes.WPARAM, wintypes.LPARAM]
+            user32.DefWindowProcW.restype = LRESULT
+            user32.CreateWindowExW.argtypes = [wintypes.DWORD, wintypes.LPCWSTR, wintypes.LPCWSTR,
+                                               wintypes.DWORD, ctypes.c_int, ctypes.c_int,
+                                               ctypes.c_int, ctypes.c_int, wintypes.HWND,
+                                               wintypes.HMENU, wintypes.HINSTANCE, wintypes.LPVOID]
+            user32.CreateWindowExW.restype = wintypes.HWND
+            kernel32.GetModuleHandleW.restype = wintypes.HMODULE
+
+            def wndproc(hwnd, msg, wparam, lparam):
+                if msg == self.WM_CLIPBOARDUPDATE:
+                    self.on_change()
+                    return 0
+                return user32.DefWindowProcW(hwnd, msg, wparam, lparam)
+
+            proc = WNDPROC(wndproc)
+            instance = kernel32.GetModuleHandleW(None)
+            wndclass = WNDCLASS(lpfnWndProc=proc, hInstance=instance,
+                                lpszClassName='RobustClipboardMonitor')
+            user32.RegisterClassW(ctypes.byref(wndclass))
+            hwnd = user32.CreateWindowExW(0, wndclass.lpszClassName, None, 0, 0, 0, 0, 0,
+                                          self.HWND_MESSAGE, None, instance, None)
+            self.active = bool(hwnd) and bool(user32.AddClipboardFormatListener(hwnd))
+        except Exception as e:
+            print(f"Clipboard listener unavailable: {e}")
+        finally:
+            ready.set()
+
+        if not self.active:
+            return
+        msg = wintypes.MSG()
+        while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+        self.active = False
+
+
+class X11ClipboardListener:
+    # Receives XFixes notifications when the CLIPBOARD selection changes owner
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self.active = False
+
+    def start(self):
+        try:
+            from Xlib import display
+            from Xlib.ext import xfixes
+
+            self.display = display.Display()
+            if not self.display.has_extension('XFIXES'):
+                return False
+            self.display.xfixes_query_version()
+            clipboard = self.display.intern_atom('CLIPBOARD')
+            self.display.xfixes_select_selection_input(
+                self.display.screen().root, clipboard,
+                xfixes.XFixesSetSelectionOwnerNotifyMask)
+        except Exception as e:
+            print(f"Clipboard listener unavailable: {e}")
+            return False
+
+        self.active = True
+        threading.Thread(target=self.run, daemon=True).start()
+        return True
+
+    def run(self):
+        notify = self.display.extension_event.SetSelectionOwnerNotify
+        try:
+            while True:
+                event = self.display.next_event()
+                if (event.type, event.sub_code) == notify:
+                    self.on_change()
+        except Exception as e:
+            print(f"Clipboard listener stopped: {e}")
+        self.active = False
+
+
+class X11Clipboard:
+    # Reads the CLIPBOARD selection over one persistent X connection instead
+    # of spawning xclip/xsel for every read
+    def __init__(self):
+        from Xlib import X, display
+
+        self.X = X
+        self.display = display.Display()
+        self.window = self.display.screen().root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+        self.clipboard = self.display.intern_atom('CLIPBOARD')
+        self.utf8_string = self.display.intern_atom('UTF8_STRING')
+        self.timestamp = self.display.intern_atom('TIMESTAMP')
+        self.incr = self.display.intern_atom('INCR')
+        self.property = self.display.intern_atom('ROBUST_CLIPBOARD_MONITOR')
+
+    def convert(self, target, property_type=None):
+        # Returns the selection converted to target, b'' if there is nothing
+        # to convert, or None if the transfer can't be completed here or the
+        # owner answered with something other than property_type
+        X = self.X
+        self.window.convert_selection(self.clipboard, target, self.property, X.CurrentTime)
+        self.display.flush()
+
+        deadline = time.monotonic() + X11_TIMEOUT
+        while True:
+            while not self.display.pending_events():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([self.display], [], [], remaining)[0]:
+                    return None
+            event = self.display.next_event()
+            # An owner that answered after an earlier request timed out leaves
+            # its reply queued; skip anything that isn't for this request
+            if (event.type == X.SelectionNotify and event.selection == self.clipboard and
+                    event.target == target and event.property in (self.property, X.NONE)):
+                break
+
+        if event.property == X.NONE:
+            return b''
+        prop = self.window.get_full_property(self.property, X.AnyPropertyType)
+        self.window.delete_property(self.property)
+        if prop is None or prop.property_type == self.incr:
+            # Large selections arrive incrementally; leave those to pyperclip
+            return None
+        if property_type is not None and prop.property_type != property_type:
+            return None
+        return prop.value
+
+    def paste(self):
+        value = self.convert(self.utf8_string, self.utf8_string)
+        if not isinstance(value, bytes):
+            # pyperclip reads it instead
+            return None
+        return value.decode('utf-8', errors='replace')
+
+    def seq(self):
+        # The owner window only changes when another client takes the
+        # selection, so pair it with the owner's TIMESTAMP for the same
+        # client copying again
+        owner = self.display.get_selection_owner(self.clipboard)
+        if owner == self.X.NONE:
+            return (0, 0)
+        value = self.convert(self.timestamp)
+        if not value:
+            return None
+        return (owner.id, value[0])
+
 
 class RobustClipboardMonitor:
-    def __init__(self, max_history=1000, json_file=JSON_FILE, txt_file=TXT_FILE):
-        self.history = []
+    def __init__(self, max_history=1000, json_file=JSON_FILE, txt_file=TXT_FILE, compress=False,
+                 legacy_json_file=LEGACY_JSON_FILE):
+        self.history = deque(maxlen=max_history)
         self.content_hashes = set()
         self.max_history = max_history
         self.json_file = json_file
         self.txt_file = txt_file
-        self.running = False
-        self.last_content = ""
+        self.archive_file = f'{json_file}.gz'
+        self.legacy_json_file = legacy_json_file
+        self.compress = compress
+        self.stop_event = threading.Event()
+        self.last_hash = 0
+        self.listener = None
+        self.clipboard_changed = threading.Event()
+        self.last_seq = None
+        self.x11 = None
+        if sys.platform.startswith('linux'):
+            try:
+                self.x11 = X11Clipboard()
+            except Exception as e:
+                print(f"Falling back to pyperclip for clipboard reads: {e}")
+        self.json_log = None
+        self.txt_log = None
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
         self.load_existing_history()
     
+    def migrate_legacy_history(self):
+        # Convert a history file from before the switch to JSONL, once
+        if (Path(self.json_file).exists() or Path(self.archive_file).exists() or
+                not Path(self.legacy_json_file).exists()):
+            return
+        try:
+            with open(self.legacy_json_file, 'rb') as f:
+                entries = [upgrade_hash(entry) for entry in orjson.loads(f.read())]
+            write_atomic(self.json_file, ''.join(
+                json.dumps(entry, separators=JSON_SEPARATORS) + '\n'
+                for entry in entries[-self.max_history:]).encode())
+            print(f"Migrated {self.legacy_json_file} to {self.json_file}")
+        except Exception as e:
+            print(f"Error migrating history: {e}")
+    
     def load_existing_history(self):
-        if Path(self.json_file).exists():
+        self.migrate_legacy_history()
+        
+        # The compressed archive, if any, holds entries older than the log
+        paths = [path for path in (self.archive_file, self.json_file) if Path(path).exists()]
+        if paths:
             try:
-                with open(self.json_file, 'r') as f:
-                    self.history = json.load(f)
-                    for entry in self.history:
-                        if 'hash' in entry:
-                            self.content_hashes.add(entry['hash'])
+                entries = {}
+                for path in paths:
+                    opener = gzip.open if path == self.archive_file else open
+                    with opener(path, 'rb') as f:
+                        line = b'\n'
+                        for line in f:
+                            try:
+                                entry = orjson.loads(line)
+                            except orjson.JSONDecodeError:
+                                # Blank or torn line from an unclean shutdown
+                                torn = True
+                                continue
+                            torn = False
+                            upgrade_hash(entry)
+                            # An entry copied again after falling out of the
+                            # history, or left in both the archive and the log
+                            # by an interrupted compaction, appears more than
+                            # once; the latest occurrence takes its place
+                            entries.pop(entry['hash'], None)
+                            entries[entry['hash']] = entry
+                    
+                    # Appends to the log must start on a fresh line, so drop a
+                    # torn last line or finish a complete one
+                    if path == self.json_file and not line.endswith(b'\n'):
+                        with open(path, 'rb+') as f:
+                            end = f.seek(0, os.SEEK_END)
+                            if torn:
+                                f.truncate(end - len(line))
+                            else:
+                                f.write(b'\n')
+                
+                # The log grows between compactions; the deque keeps only the
+                # newest max_history entries
+                self.history.extend(entries.values())
+                self.content_hashes = {int(entry['hash'], 16) for entry in self.history}
                 print(f"Loaded {len(self.history)} existing entries")
             except Exception as e:
                 print(f"Error loading history: {e}")
     
-    def is_duplicate(self, content):
-        content_hash = hashlib.md5(content.encode()).hexdigest()
+    def is_duplicate(self, content_hash):
         return content_hash in self.content_hashes
     
-    def add_to_history(self, content):
-        if self.is_duplicate(content):
+    def add_to_history(self, content, precomputed_hash=None):
+        content_hash = precomputed_hash
+        if content_hash is None:
+            content_hash = xxhash.xxh3_64_intdigest(content.encode())
+        if self.is_duplicate(content_hash):
             return False
         
-        content_hash = hashlib.md5(content.encode()).hexdigest()
         self.content_hashes.add(content_hash)
         
         entry = {
             'content': content,
             'timestamp': datetime.now().isoformat(),
-            'hash': content_hash,
+            'hash': format_hash(content_hash),
             'length': len(content)
         }
         
+        # The deque drops its oldest entry on append once it is full
+        if self.history and len(self.history) == self.max_history:
+            self.content_hashes.discard(int(self.history[0]['hash'], 16))
         self.history.append(entry)
         
-        if len(self.history) > self.max_history:
-            removed = self.history.pop(0)
-            if 'hash' in removed:
-                self.content_hashes.discard(removed['hash'])
-        
+        with self.lock:
+            self.pending.append(entry)
         return True
     
+    def maybe_flush(self):
+        if (len(self.pending) >= FLUSH_BATCH_SIZE or
+            time.monotonic() - self.last_flush > FLUSH_INTERVAL):
+            self.flush_pending()
+    
+    def flush_pending(self):
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.pending:
+                return
+            entries, self.pending = self.pending, []
+            
+            try:
+                if self.json_log is None:
+                    self.json_log = open(self.json_file, 'a', encoding='utf-8')
+                    self.txt_log = open(self.txt_file, 'a', encoding='utf-8')
+                
+                self.json_log.write(''.join(json.dumps(entry, separators=JSON_SEPARATORS) + '\n'
+                                            for entry in entries))
+                self.txt_log.write(''.join(f"{entry['content']}\n" for entry in entries
+                                           if entry['content'].startswith(URL_PREFIX)))
+                
+                for log in (self.json_log, self.txt_log):
+                    log.flush()
+                    os.fsync(log.fileno())
+            except Exception as e:
+                print(f"Error saving history: {e}")
+    
     def monitor_loop(self):
         # Get initial clipboard content
         try:
-            self.last_content = pyperclip.paste()
+            self.last_seq = self.get_clipboard_seq()
+            self.last_hash = xxhash.xxh3_64_intdigest(self.read_clipboard().encode())
         except:
-            self.last_content = ""
+            self.last_hash = 0
+        
+        self.start_listener()
         
-        while self.running:
+        while not self.stop_event.is_set():
             try:
-                current_content = pyperclip.paste()
+                if not self.wait_for_change():
+                    self.maybe_flush()
+                    continue
                 
-                if (current_content != self.last_content and 
-                    current_content and 
-                    current_content.strip()):
+                current_content = self.read_clipboard()
+                
+                # Most copies are not URLs, so reject them before hashing
+                if current_content.startswith(URL_PREFIX):
+                    # One pass over the content serves both change detection and dedup
+                    content_hash = xxhash.xxh3_64_intdigest(current_content.encode())
                     
-                    if current_content.startswith("https://"):
-                        if self.add_to_history(current_content):
+                    if content_hash != self.last_hash:
+                        self.last_hash = content_hash
+                        if self.add_to_history(current_content, content_hash):
                             print(f"New content: {current_content[:50]}...")
-                            self.save_history()                
-                time.sleep(0.5)  # Check every 500ms
+                self.maybe_flush()
                 
             except Exception as e:
                 print(f"Error reading clipboard: {e}")
-                time.sleep(1)  # Wait longer on error
+                self.stop_event.wait(1)  # Wait longer on error
+    
+    def start_listener(self):
+        if sys.platform == 'win32':
+            listener = Win32ClipboardListener(self.clipboard_changed.set)
+        elif sys.platform.startswith('linux'):
+            listener = X11ClipboardListener(self.clipboard_changed.set)
+        else:
+            return
+        if listener.start():
+            self.listener = listener
+    
+    def wait_for_change(self):
+        # Only fetch the clipboard once the OS reports a change; fall back
+        # to reading it on every poll when no notification source exists
+        if self.listener is not None and self.listener.active:
+            # Clear only after a notification arrived, so one set after the
+            # wait timed out is kept for the next call
+            if self.clipboard_changed.wait(POLL_INTERVAL):
+                self.clipboard_changed.clear()
+                return True
+            return False
+        
+        # The change counter is far cheaper than copying the clipboard out
+        self.stop_event.wait(POLL_INTERVAL if self.last_seq is not None else FALLBACK_POLL_INTERVAL)
+        seq = self.get_clipboard_seq()
+        if seq is None:
+            return True
+        changed = seq != self.last_seq
+        self.last_seq = seq
+        return changed
+    
+    def get_clipboard_seq(self):
+        # Counter that changes whenever the clipboard does, or None if the
+        # platform does not expose one
+        if sys.platform == 'win32':
+            return ctypes.windll.user32.GetClipboardSequenceNumber()
+        if NSPasteboard is not None:
+            return NSPasteboard.generalPasteboard().changeCount()
+        if self.x11 is not None:
+            return self.x11.seq()
+        return None
+    
+    def read_clipboard(self):
+        if self.x11 is not None:
+            content = self.x11.paste()
+            if content is not None:
+                return content
+        return pyperclip.paste()
     
     def start_monitoring(self):
-        self.running = True
+        self.stop_event.clear()
+        atexit.register(self.flush_pending)
         monitor_thread = threading.Thread(target=self.monitor_loop, daemon=True)
         monitor_thread.start()
         
         print("Clipboard monitoring started... Press Ctrl+C to stop")
         try:
-            while self.running:
-                time.sleep(1)
+            # Block until stopped; lock waits can't be interrupted by
+            # Ctrl+C on Windows, so wake up periodically there
+            timeout = 1 if sys.platform == 'win32' else None
+            while not self.stop_event.wait(timeout):
+                pass
         except KeyboardInterrupt:
             self.stop_monitoring()
     
     def stop_monitoring(self):
-        self.running = False
+        self.stop_event.set()
+        self.flush_pending()
         self.save_history()
         print(f"\nMonitoring stopped. Total entries: {len(self.history)}")
     
     def save_history(self):
-        try:
-            # Save JSON version
-            with open(self.json_file, 'w') as f:
-                json.dump(self.history, f, indent=2)
-            
-            # Save TXT version
-            with open(self.txt_file, 'w') as f:
-                for entry in self.history:
-                    if entry['content'].startswith('https://'):
-                        f.write(f"{entry['content']}\n")
-                    
-        except Exception as e:
-            print(f"Error saving history: {e}")
+        # Compact the append-only logs down to the retained history
+        with self.lock:
+            # Pending entries are part of self.history and get written below
+            self.pending = []
+            try:
+                for log in (self.json_log, self.txt_log):
+                    if log is not None:
+                        log.close()
+                self.json_log = None
+                self.txt_log = None
+                
+                # Save JSON version, either gzipped into the archive with an
+                # empty log left behind, or as a plain log
+                data = ''.join(json.dumps(entry, separators=JSON_SEPARATORS) + '\n'
+                               for entry in self.history).encode()
+                if self.compress:
+                    write_atomic(self.archive_file, gzip.compress(data))
+                    write_atomic(self.json_file, b'')
+                else:
+                    write_atomic(self.json_file, data)
+                    if Path(self.archive_file).exists():
+                        os.remove(self.archive_file)
+                
+                # Save TXT version
+                write_atomic(self.txt_file, ''.join(
+                    f"{entry['content']}\n" for entry in self.history
+                    if entry['content'].startswith(URL_PREFIX)).encode())
+                        
+            except Exception as e:
+                print(f"Error saving history: {e}")
 
 # Usage
 if __name__ == "__main__":
@@ -6,19 +6,21 @@ A simple application to display code with syntax highlighting for multiple langu
 """
 
 import argparse
+import functools
+import html
+import json
 import os
 import sys
 import tempfile
-import webbrowser
 from pathlib import Path
+from string import Template
 from typing import Optional, TextIO, Union
 
-from pygments import highlight
-from pygments.lexers import get_lexer_for_filename, get_lexer_by_name, PythonLexer
-from pygments.formatters import TerminalFormatter, HtmlFormatter
+from pygments.lexers import get_lexer_for_filename
 from pygments.util import ClassNotFound
-from rich.console import Console
-from rich.syntax import Syntax
+
+# Largest source file accepted, in bytes
+MAX_FILE_SIZE = 2_000_000
 
 
 def highlight_code_rich(code: str, language: str, output_file: Optional[TextIO] = None) -> None:
@@ -31,6 +33,10 @@ def highlight_code_rich(code: str, language: str, output_file: Optional[TextIO]
         language: The programming language
         output_file: Optional file to write the highlighted code to
     """
+    # Rich is only needed for terminal output, so keep it off the HTML paths
+    from rich.console import Console
+    from rich.syntax import Syntax
+
     console = Console(file=output_file or sys.stdout)
     syntax = Syntax(code, language, theme="monokai", line_numbers=True)
     console.print(syntax)
@@ -46,6 +52,12 @@ def detect_language(filename: str) -> str:
     Returns:
         str: The detected language or 'python' as fallback
     """
+    # Lexer patterns only ever look at the base name
+    return _detect_language_cached(os.path.basename(filename))
+
+
+@functools.lru_cache(maxsize=256)
+def _detect_language_cached(filename: str) -> str:
     try:
         lexer = get_lexer_for_filename(filename)
         return lexer.aliases[0]
@@ -54,30 +66,18 @@ def detect_language(filename: str) -> str:
         return "python"
 
 
-def generate_modern_html(code: str, filename: str, language: str) -> str:
-    """
-    Generate modern HTML with a shadcn-like dark theme for syntax highlighting using Prism.js.
-    
-    Args:
-        code: The code to highlight
-        filename: The name of the file being highlighted
-        language: The programming language
-    
-    Returns:
-        str: The complete HTML content
-    """
-    # Create the complete HTML with modern styling and Prism.js
-    html_content = f"""<!DOCTYPE html>
+# Page chrome shared by every generated file; only the $-placeholders vary
+_HTML_TEMPLATE = Template("""<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{filename} - Syntax Highlighter</title>
+    <title>$filename - Syntax Highlighter</title>
     <!-- Prism CSS -->
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/prism/1.29.0/themes/prism-tomorrow.min.css">
     <style>
         /* Modern shadcn-like dark theme */
-        :root {{
+        :root {
             --background: #09090b;
             --foreground: #fafafa;
             --card: #171717;
@@ -98,15 +98,15 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             --input: #27272a;
             --ring: #6366f1;
             --radius: 0.5rem;
-        }}
+        }
 
-        * {{
+        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
+        }
 
-        body {{
+        body {
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, 'Open Sans', 'Helvetica Neue', sans-serif;
             background-color: var(--background);
             color: var(--foreground);
@@ -116,82 +116,82 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             min-height: 100vh;
             display: flex;
             flex-direction: column;
-        }}
+        }
 
-        .container {{
+        .container {
             max-width: 1200px;
             margin: 0 auto;
             padding: 2rem;
             width: 100%;
-        }}
+        }
 
-        header {{
+        header {
             background-color: var(--card);
             border-bottom: 1px solid var(--border);
             padding: 1rem 0;
-        }}
+        }
 
-        .header-content {{
+        .header-content {
             display: flex;
             justify-content: space-between;
             align-items: center;
-        }}
+        }
 
-        h1 {{
+        h1 {
             font-size: 1.5rem;
             font-weight: 600;
             color: var(--foreground);
             margin: 0;
-        }}
+        }
 
-        .file-info {{
+        .file-info {
             font-size: 0.875rem;
             color: var(--muted-foreground);
-        }}
+        }
 
-        main {{
+        main {
             flex: 1;
             padding: 2rem 0;
-        }}
+        }
 
-        .code-container {{
+        .code-container {
             background-color: var(--card);
             border-radius: var(--radius);
             overflow: hidden;
             border: 1px solid var(--border);
             box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
             position: relative;
-        }}
+        }
 
-        .code-header {{
+        .code-header {
             background-color: var(--secondary);
             padding: 0.75rem 1rem;
             border-bottom: 1px solid var(--border);
             display: flex;
             justify-content: space-between;
             align-items: center;
-        }}
+        }
 
-        .code-title {{
+        .code-title {
             font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace;
             font-size: 0.875rem;
             color: var(--foreground);
-        }}
+        }
 
-        .code-actions {{
+        .code-actions {
             display: flex;
             gap: 0.5rem;
-        }}
+        }
 
-        .code-language {{
+        .code-language {
             font-size: 0.75rem;
             color: var(--primary);
             background-color: var(--muted);
             padding: 0.25rem 0.5rem;
             border-radius: var(--radius);
-        }}
+        }
 
-        .button {{
+        .button {
             background-color: var(--muted);
             color: var(--muted-foreground);
             border: none;
@@ -203,62 +203,62 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             display: flex;
             align-items: center;
             gap: 0.25rem;
-        }}
+        }
 
-        .button:hover {{
+        .button:hover {
             background-color: var(--primary);
             color: var(--primary-foreground);
-        }}
+        }
 
-        .button.success {{
+        .button.success {
             background-color: #10b981;
             color: white;
-        }}
+        }
 
-        .code-content {{
+        .code-content {
             padding: 1rem;
             overflow-x: auto;
-        }}
+        }
 
         /* Prism.js customizations */
-        pre[class*="language-"] {{
+        pre[class*="language-"] {
             margin: 0;
             border-radius: 0;
             background-color: var(--card);
-        }}
+        }
 
-        code[class*="language-"] {{
+        code[class*="language-"] {
             font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace;
             font-size: 0.875rem;
             line-height: 1.7;
-        }}
+        }
 
-        .line-numbers .line-numbers-rows {{
+        .line-numbers .line-numbers-rows {
             border-right: 1px solid var(--border);
             opacity: 0.5;
-        }}
+        }
 
-        .line-numbers-rows > span:before {{
+        .line-numbers-rows > span:before {
             color: #666 !important;
             opacity: 0.6;
-        }}
+        }
 
-        footer {{
+        footer {
             background-color: var(--card);
             border-top: 1px solid var(--border);
             padding: 1rem 0;
             font-size: 0.875rem;
             color: var(--muted-foreground);
             text-align: center;
-        }}
+        }
 
         /* Language selector */
-        .language-selector {{
+        .language-selector {
             position: relative;
             display: inline-block;
-        }}
+        }
 
-        .language-selector select {{
+        .language-selector select {
             appearance: none;
             background-color: var(--muted);
             color: var(--primary);
@@ -268,9 +268,9 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             padding-right: 1.5rem;
             font-size: 0.75rem;
             cursor: pointer;
-        }}
+        }
 
-        .language-selector::after {{
+        .language-selector::after {
             content: '▼';
             font-size: 0.5rem;
             position: absolute;
@@ -279,10 +279,10 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             transform: translateY(-50%);
             pointer-events: none;
             color: var(--primary);
-        }}
+        }
 
         /* Editor modal */
-        .modal {{
+        .modal {
             display: none;
             position: fixed;
             top: 0;
@@ -293,13 +293,13 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             z-index: 1000;
             justify-content: center;
             align-items: center;
-        }}
+        }
 
-        .modal.active {{
+        .modal.active {
             display: flex;
-        }}
+        }
 
-        .modal-content {{
+        .modal-content {
             background-color: var(--card);
             border-radius: var(--radius);
             width: 80%;
@@ -308,47 +308,47 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             overflow: hidden;
             display: flex;
             flex-direction: column;
-        }}
+        }
 
-        .modal-header {{
+        .modal-header {
             background-color: var(--secondary);
             padding: 1rem;
             border-bottom: 1px solid var(--border);
             display: flex;
             justify-content: space-between;
             align-items: center;
-        }}
+        }
 
-        .modal-title {{
+        .modal-title {
             font-size: 1rem;
             font-weight: 600;
             color: var(--foreground);
-        }}
+        }
 
-        .modal-close {{
+        .modal-close {
             background: none;
             border: none;
             color: var(--muted-foreground);
             cursor: pointer;
             font-size: 1.5rem;
             line-height: 1;
-        }}
+        }
 
-        .modal-body {{
+        .modal-body {
             padding: 1rem;
             overflow-y: auto;
             flex: 1;
-        }}
+        }
 
-        .modal-footer {{
+        .modal-footer {
             padding: 1rem;
             border-top: 1px solid var(--border);
             display: flex;
             justify-content: flex-end;
             gap: 0.5rem;
-        }}
+        }
 
-        .code-editor {{
+        .code-editor {
             width: 100%;
             height: 300px;
             background-color: var(--background);
@@ -360,12 +360,12 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             font-size: 0.875rem;
             line-height: 1.7;
             resize: vertical;
-        }}
+        }
 
-        .code-editor:focus {{
+        .code-editor:focus {
             outline: 2px solid var(--ring);
             outline-offset: 2px;
-        }}
+        }
     </style>
 </head>
 <body>
@@ -373,7 +373,7 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
         <div class="container header-content">
             <h1>Syntax Highlighter</h1>
             <div class="file-info">
-                <span>{filename}</span>
+                <span>$filename</span>
             </div>
         </div>
     </header>
@@ -381,7 +381,7 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
     <main class="container">
         <div class="code-container">
             <div class="code-header">
-                <span class="code-title">{filename}</span>
+                <span class="code-title">$filename</span>
                 <div class="code-actions">
                     <div class="language-selector">
                         <select id="language-select" onchange="changeLanguage()">
@@ -424,7 +424,7 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
                 </div>
             </div>
             <div class="code-content">
-                <pre><code id="code-display" class="line-numbers language-{language}">{code}</code></pre>
+                <pre><code id="code-display" class="line-numbers language-$language">$code</code></pre>
             </div>
         </div>
     </main>
@@ -459,19 +459,19 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
     
     <script>
         // Store the original code
-        let currentCode = `{code.replace('`', '\\`')}`;
+        let currentCode = $code_js;
         
         // Set the initial language
-        document.addEventListener('DOMContentLoaded', function() {{
+        document.addEventListener('DOMContentLoaded', function() {
             const languageSelect = document.getElementById('language-select');
-            languageSelect.value = '{language}';
+            languageSelect.value = '$language';
             
             // Highlight the code
             Prism.highlightAll();
-        }});
+        });
         
         // Function to copy code to clipboard
-        function copyCode() {{
+        function copyCode() {
             const copyButton = document.querySelector('.button');
             const copyText = copyButton.querySelector('span');
             
@@ -488,27 +488,27 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             copyText.textContent = 'Copied!';
             
             // Reset button state after 2 seconds
-            setTimeout(() => {{
+            setTimeout(() => {
                 copyButton.classList.remove('success');
                 copyText.textContent = 'Copy';
-            }}, 2000);
-        }}
+            }, 2000);
+        }
         
         // Function to change the language
-        function changeLanguage() {{
+        function changeLanguage() {
             const languageSelect = document.getElementById('language-select');
             const codeElement = document.getElementById('code-display');
             const selectedLanguage = languageSelect.value;
             
             // Update the class
-            codeElement.className = `line-numbers language-${{selectedLanguage}}`;
+            codeElement.className = `line-numbers language-$${selectedLanguage}`;
             
             // Re-highlight the code
             Prism.highlightElement(codeElement);
-        }}
+        }
         
         // Function to open the editor modal
-        function openEditor() {{
+        function openEditor() {
             const modal = document.getElementById('editor-modal');
             const editor = document.getElementById('code-editor');
             
@@ -520,16 +520,16 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             
             // Focus the editor
             editor.focus();
-        }}
+        }
         
         // Function to close the editor modal
-        function closeEditor() {{
+        function closeEditor() {
             const modal = document.getElementById('editor-modal');
             modal.classList.remove('active');
-        }}
+        }
         
         // Function to update the code from the editor
-        function updateCode() {{
+        function updateCode() {
             const editor = document.getElementById('code-editor');
             const codeElement = document.getElementById('code-display');
             
@@ -544,12 +544,30 @@ def generate_modern_html(code: str, filename: str, language: str) -> str:
             
             // Close the modal
             closeEditor();
-        }}
+        }
     </script>
 </body>
 </html>
-"""
-    return html_content
+""")
+
+
+def generate_modern_html(code: str, filename: str, language: str) -> str:
+    """
+    Generate modern HTML with a shadcn-like dark theme for syntax highlighting using Prism.js.
+    
+    Args:
+        code: The code to highlight
+        filename: The name of the file being highlighted
+        language: The programming language
+    
+    Returns:
+        str: The complete HTML content
+    """
+    # A JSON string is a valid JS literal; escape "</" so the code cannot
+    # close the surrounding <script> element
+    code_js = json.dumps(code).replace('</', '<\\/')
+    return _HTML_TEMPLATE.substitute(filename=html.escape(filename), language=language,
+                                     code=html.escape(code, quote=False), code_js=code_js)
 
 
 def highlight_code_html(code: str, output_file: TextIO, language: str) -> None:
@@ -585,10 +603,16 @@ def open_in_browser(code: str, language: str) -> None:
     # Generate the modern HTML content
     html_content = generate_modern_html(code, os.path.basename(filename), language)
     
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(suffix='.html', delete=False) as temp_file:
-        temp_path = temp_file.name
-        temp_file.write(html_content.encode('utf-8'))
+    import webbrowser
+
+    # Create a temporary file and write the page straight to its descriptor
+    fd, temp_path = tempfile.mkstemp(suffix='.html')
+    try:
+        data = memoryview(html_content.encode('utf-8'))
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
     
     # Convert to file:// URL format
     file_url = f"file://{os.path.abspath(temp_path)}"
@@ -626,11 +650,16 @@ def main() -> None:
     args = parser.parse_args()
     
     try:
-        code = Path(args.file).read_text()
+        raw = Path(args.file).read_bytes()
     except Exception as e:
         print(f"Error reading file: {e}", file=sys.stderr)
         sys.exit(1)
     
+    if len(raw) > MAX_FILE_SIZE:
+        print(f"File too large: {len(raw)} bytes (limit {MAX_FILE_SIZE})", file=sys.stderr)
+        sys.exit(1)
+    code = raw.decode('utf-8', errors='replace')
+    
     # Detect or use specified language
     language = args.language or detect_language(args.file)
     
@@ -1,21 +1,36 @@
 #!/usr/bin/env python
 
 import boto3
-import json
+import functools
 import hashlib
+import lxml.html
+import orjson
 import os
+import re
 import requests
+import threading
 import time
 
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
-from urllib.parse import urlparse
+from botocore.config import Config
+from lxml import etree
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Configuration
 HTML_CACHE_DIR = "./html"
+HASHTAG_CACHE_FILE = "./hashtags_cache.json"
 JSON_OUTPUT_FILE = os.environ.get("JSON_OUTPUT_FILE", "url_data.json")
-MAX_WORKERS = 5
+PROGRESS_FILE = JSON_OUTPUT_FILE + ".partial.jsonl"  # Pages extracted by a run that has not finished
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", 5))  # Concurrent Bedrock calls, kept under the service quota
+# Concurrent URL fetches; I/O bound, so well above the core count
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", min(64, 4 * (os.cpu_count() or 4))))
 REQUEST_TIMEOUT = 10
+HASHTAG_BATCH_SIZE = 10  # Documents per Bedrock hashtag request
+MIN_REQUEST_INTERVAL = 1.0  # Seconds between requests to the same host
+MAX_BODY_LENGTH = 10000  # Characters of body text kept per page
+PROMPT_BODY_LENGTH = 1000  # Characters of body text sent to Bedrock, to limit tokens
 USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
 HEADERS = {
     "User-Agent": USER_AGENT,
@@ -23,164 +38,367 @@ HEADERS = {
     "Accept-Language": "en-US,en;q=0.5",
 }
 
+# Bedrock request pieces that are the same for every call
+BEDROCK_MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'  # Using Claude 3 Sonnet
+BEDROCK_REQUEST_BASE = {"anthropic_version": "bedrock-2023-05-31"}
+HASHTAG_PROMPT = (
+    "Based on the following title and content, suggest 3-5 relevant hashtags.\n"
+    "Return only the hashtags separated by spaces, without any explanation.\n\n"
+    "Title: {title}\n\n"
+    "Content: {body}"
+)
+BATCH_HASHTAG_PROMPT = (
+    "For each numbered document below, suggest 3-5 relevant hashtags.\n"
+    'Reply with a JSON array of objects of the form {{"id": <document number>, '
+    '"tags": "<hashtags separated by spaces>"}}.\n\n'
+    "{documents}"
+)
+BATCH_DOCUMENT = "Document {id}:\nTitle: {title}\nContent: {body}"
+
 # Create cache directory if it doesn't exist
-os.makedirs(HTML_CACHE_DIR, exist_ok=True)
+CACHE_DIR = Path(HTML_CACHE_DIR)
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Shared session so worker threads reuse keep-alive connections per host
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_adapter = HTTPAdapter(
+    pool_connections=FETCH_WORKERS,
+    pool_maxsize=FETCH_WORKERS * 2,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+# Shared Bedrock client; clients are thread-safe and costly to build
+BEDROCK_RUNTIME = boto3.client(
+    'bedrock-runtime',
+    region_name='us-west-2',
+    config=Config(max_pool_connections=MAX_WORKERS * 2, retries={'max_attempts': 3, 'mode': 'adaptive'}),
+)
+
+# Keeps Bedrock concurrency at MAX_WORKERS however wide the fetch pool is
+_bedrock_slots = threading.BoundedSemaphore(MAX_WORKERS)
+
+# Paragraph selectors compiled once instead of on every page
+_CONTENT_PARAGRAPHS = etree.XPath(
+    "//main//p | //article//p"
+    " | //div[contains(concat(' ', normalize-space(@class), ' '), ' content ')]//p"
+)
+_ALL_PARAGRAPHS = etree.XPath("//p")
+
+# HTML parsers, built once per worker thread; a shared lxml parser would
+# serialize parsing across the fetch pool
+_parsers = threading.local()
+
+# Authority part of a URL, the same span urlparse() reports as netloc
+_NETLOC_RE = re.compile(r'^[a-z][a-z0-9+.-]*://([^/?#]*)', re.IGNORECASE)
+
+# Per-host locks and last request times for polite rate limiting
+_host_locks = {}
+_last_request = {}
 
+def write_atomic(path, data):
+    """Write data to a temporary file and swap it in, so an interrupted write leaves path intact"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def load_hashtag_cache():
+    """Load hashtags generated by earlier runs, keyed by hashtag_cache_key"""
+    try:
+        with open(HASHTAG_CACHE_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
+
+def save_hashtag_cache():
+    """Persist the hashtag cache for later runs"""
+    write_atomic(HASHTAG_CACHE_FILE, orjson.dumps(_hashtag_cache))
+
+def hashtag_cache_key(title, prompt_body):
+    """Hash exactly the content that is sent to Bedrock"""
+    return hashlib.blake2b(f"{title}\n{prompt_body}".encode('utf-8'), digest_size=16).hexdigest()
+
+_hashtag_cache = load_hashtag_cache()
+
+def get_netloc(url):
+    """Return the network location of a URL without building a full ParseResult"""
+    match = _NETLOC_RE.match(url)
+    return match.group(1) if match else ""
+
+@functools.lru_cache(maxsize=8192)
 def get_filename_from_url(url):
     """Generate a filename from URL using hash to avoid filesystem issues"""
-    url_hash = hashlib.md5(url.encode()).hexdigest()
-    parsed_url = urlparse(url)
-    domain = parsed_url.netloc.replace(".", "_")
+    url_hash = hashlib.blake2b(url.encode('utf-8'), digest_size=8).hexdigest()
+    domain = get_netloc(url).replace(".", "_")
     return f"{domain}_{url_hash}.html"
 
+def wait_for_host(url):
+    """Block until at least MIN_REQUEST_INTERVAL has passed since the last request to the URL's host"""
+    netloc = get_netloc(url)
+    with _host_locks.setdefault(netloc, threading.Lock()):
+        elapsed = time.monotonic() - _last_request.get(netloc, float("-inf"))
+        if elapsed < MIN_REQUEST_INTERVAL:
+            time.sleep(MIN_REQUEST_INTERVAL - elapsed)
+        _last_request[netloc] = time.monotonic()
+
 def fetch_html(url):
     """Fetch HTML content from URL or retrieve from cache"""
     filename = get_filename_from_url(url)
-    cache_path = os.path.join(HTML_CACHE_DIR, filename)
+    cache_path = CACHE_DIR / filename
     
-    # Check if cached version exists
-    if os.path.exists(cache_path):
+    # Use the cached version if it exists
+    try:
+        with open(cache_path, 'rb') as f:
+            html_content = f.read().decode('utf-8', 'replace')
         print(f"Using cached version for {url}")
-        with open(cache_path, 'r', encoding='utf-8', errors='replace') as f:
-            return f.read()
+        return html_content
+    except FileNotFoundError:
+        pass
     
     # Fetch from web
     try:
         print(f"Fetching {url}")
-        response = requests.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+        wait_for_host(url)
+        response = SESSION.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         html_content = response.text
         
         # Cache the content
-        with open(cache_path, 'w', encoding='utf-8', errors='replace') as f:
-            f.write(html_content)
+        with open(cache_path, 'wb') as f:
+            f.write(html_content.encode('utf-8', 'replace'))
         
-        # Be nice to servers
-        time.sleep(1)
         return html_content
     except Exception as e:
         print(f"Error fetching {url}: {e}")
         return None
 
+def get_html_parser():
+    """Return this thread's lxml HTML parser"""
+    parser = getattr(_parsers, "html", None)
+    if parser is None:
+        # Parse from UTF-8 bytes; lxml rejects str input that carries an
+        # XML encoding declaration
+        parser = _parsers.html = lxml.html.HTMLParser(encoding='utf-8')
+    return parser
+
 def extract_content(url, html_content):
     """Extract title and body text from HTML"""
     if not html_content:
         return {"url": url, "title": "", "body": ""}
     
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
+        tree = lxml.html.fromstring(html_content.encode('utf-8', 'replace'), parser=get_html_parser())
         
         # Extract title
-        title = ""
-        title_tag = soup.find('title')
-        if title_tag:
-            title = title_tag.get_text(strip=True)
+        title = (tree.findtext('.//title') or "").strip()
         
         # Extract body text
-        # First try to find main content areas
-        main_content = soup.find('main') or soup.find('article') or soup.find('div', class_='content')
-        
-        if main_content:
-            # Extract text from main content
-            paragraphs = main_content.find_all('p')
-            body = ' '.join([p.get_text(strip=True) for p in paragraphs])
-        else:
-            # Fallback to all paragraphs
-            paragraphs = soup.find_all('p')
-            body = ' '.join([p.get_text(strip=True) for p in paragraphs])
+        # Paragraphs in main content areas, falling back to all paragraphs
+        paragraphs = _CONTENT_PARAGRAPHS(tree) or _ALL_PARAGRAPHS(tree)
+        # Stop collecting text once the joined body is past the limit
+        texts = []
+        length = -1  # No separator before the first paragraph
+        for p in paragraphs:
+            text = ' '.join(p.text_content().split())
+            texts.append(text)
+            length += len(text) + 1
+            if length > MAX_BODY_LENGTH:
+                break
+        body = ' '.join(texts)
         
         # Truncate body if it's too long (to avoid issues with Bedrock API limits)
-        if len(body) > 10000:
-            body = body[:10000] + "..."
+        if len(body) > MAX_BODY_LENGTH:
+            body = body[:MAX_BODY_LENGTH] + "..."
             
         return {"url": url, "title": title, "body": body}
+    except etree.ParserError:
+        # Empty or whitespace-only page
+        return {"url": url, "title": "", "body": ""}
     except Exception as e:
         print(f"Error extracting content from {url}: {e}")
         return {"url": url, "title": "", "body": ""}
 
-def generate_hashtags(title, body):
-    """Generate hashtags using Amazon Bedrock Nova model"""
-    try:
-        # Initialize Bedrock client
-        bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-west-2')
-        
-        # Prepare prompt for Nova
-        prompt = f"""
-        Based on the following title and content, suggest 3-5 relevant hashtags.
-        Return only the hashtags separated by spaces, without any explanation.
-        
-        Title: {title}
-        
-        Content: {body[:1000]}  # Limit content to avoid token limits
-        """
-        
-        # Call Bedrock Nova model
-        response = bedrock_runtime.invoke_model(
-            modelId='anthropic.claude-3-sonnet-20240229-v1:0',  # Using Claude 3 Sonnet
+def invoke_bedrock(prompt, max_tokens, system=None):
+    """Send a single user prompt to Claude on Bedrock and return the reply text"""
+    request = {
+        **BEDROCK_REQUEST_BASE,
+        "max_tokens": max_tokens,
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    }
+    if system:
+        request["system"] = system
+    
+    with _bedrock_slots:
+        response = BEDROCK_RUNTIME.invoke_model(
+            modelId=BEDROCK_MODEL_ID,
             contentType='application/json',
             accept='application/json',
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 100,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            })
+            body=orjson.dumps(request)
         )
-        
-        # Parse response
-        response_body = json.loads(response['body'].read().decode('utf-8'))
-        hashtags = response_body['content'][0]['text'].strip()
-        
+    
+    # Parse response
+    response_body = orjson.loads(response['body'].read())
+    return response_body['content'][0]['text'].strip()
+
+def generate_hashtags(title, body):
+    """Generate hashtags using Amazon Bedrock Nova model"""
+    prompt_body = body[:PROMPT_BODY_LENGTH]
+    key = hashtag_cache_key(title, prompt_body)
+    if key in _hashtag_cache:
+        return _hashtag_cache[key]
+    
+    try:
+        prompt = HASHTAG_PROMPT.format(title=title, body=prompt_body)
+        hashtags = invoke_bedrock(prompt, 100)
+        _hashtag_cache[key] = hashtags
         return hashtags
     except Exception as e:
         print(f"Error generating hashtags: {e}")
         return ""
 
-def process_url(url):
-    """Process a single URL: fetch HTML, extract content, generate hashtags"""
-    html_content = fetch_html(url)
-    content_data = extract_content(url, html_content)
+def generate_hashtags_for_batch(documents):
+    """Generate hashtags for several (title, prompt_body) pairs with a single Bedrock call"""
+    prompt = BATCH_HASHTAG_PROMPT.format(documents="\n\n".join(
+        BATCH_DOCUMENT.format(id=i, title=title, body=prompt_body)
+        for i, (title, prompt_body) in enumerate(documents, 1)
+    ))
     
-    # Generate hashtags if we have content
-    if content_data["title"] or content_data["body"]:
-        hashtags = generate_hashtags(content_data["title"], content_data["body"])
-        content_data["hashtags"] = hashtags
-    else:
-        content_data["hashtags"] = ""
+    try:
+        reply = invoke_bedrock(prompt, 100 * len(documents), system="Return JSON only.")
+    except Exception as e:
+        # Bedrock refused or could not be reached; leave the hashtags empty
+        # for "update with hashtags" to retry rather than adding more load
+        print(f"Error generating hashtags for batch: {e}")
+        return [""] * len(documents)
+    
+    try:
+        items = orjson.loads(reply[reply.index("["):reply.rindex("]") + 1])
+        tags = {int(item["id"]): item["tags"].strip() for item in items}
+    except Exception as e:
+        print(f"Error parsing hashtags for batch: {e}")
+        tags = {}
     
-    return content_data
+    # Anything the batch reply did not cover gets its own request
+    return [tags.get(i) or generate_hashtags(title, prompt_body)
+            for i, (title, prompt_body) in enumerate(documents, 1)]
+
+def generate_hashtags_batch(entries, batch_size=HASHTAG_BATCH_SIZE):
+    """Set "hashtags" on each entry, sending up to batch_size documents per Bedrock call"""
+    # Entries with identical content share one request. The body is cut down
+    # to the prompt length once here; the batch calls only see the short text
+    uncached = {}
+    documents = {}
+    for entry in entries:
+        title, body = entry["title"], entry["body"]
+        if not (title or body):
+            entry["hashtags"] = ""
+            continue
+        prompt_body = body[:PROMPT_BODY_LENGTH]
+        key = hashtag_cache_key(title, prompt_body)
+        if key in _hashtag_cache:
+            entry["hashtags"] = _hashtag_cache[key]
+        else:
+            uncached.setdefault(key, []).append(entry)
+            documents.setdefault(key, (title, prompt_body))
+    
+    keys = list(uncached)
+    key_batches = [keys[start:start + batch_size] for start in range(0, len(keys), batch_size)]
+    batches = [[documents[key] for key in batch_keys] for batch_keys in key_batches]
+    
+    # Bedrock calls are pure network latency, so run the batches concurrently
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for batch_keys, batch_hashtags in zip(key_batches, executor.map(generate_hashtags_for_batch, batches)):
+            for key, hashtags in zip(batch_keys, batch_hashtags):
+                for entry in uncached[key]:
+                    entry["hashtags"] = hashtags
+                if hashtags:
+                    _hashtag_cache[key] = hashtags
+
+def fetch_and_extract(url):
+    """Fetch HTML for a single URL and extract its content"""
+    html_content = fetch_html(url)
+    return extract_content(url, html_content)
+
+def save_results(results):
+    """Write results to JSON_OUTPUT_FILE"""
+    write_atomic(JSON_OUTPUT_FILE, orjson.dumps(results, option=orjson.OPT_INDENT_2))
+
+def load_progress():
+    """Read the pages an interrupted run left in PROGRESS_FILE"""
+    results = []
+    with open(PROGRESS_FILE, 'rb') as f:
+        for line in f:
+            try:
+                results.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                # Torn last line from the interruption
+                continue
+    return results
 
 def process_urls_from_file(input_file):
     """Process all URLs from input file"""
-    # Read URLs from file
-    with open(input_file, 'r') as f:
-        urls = [line.strip() for line in f if line.strip()]
+    # Read URLs from file, dropping repeats but keeping first-seen order
+    lines = [line.strip() for line in Path(input_file).read_text().splitlines()]
+    lines = [line for line in lines if line]
+    urls = list(dict.fromkeys(lines))
+    if len(urls) < len(lines):
+        print(f"Skipping {len(lines) - len(urls)} duplicate URLs")
     
-    results = []
+    results = [None] * len(urls)
     
-    # Process URLs in parallel
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        results = list(executor.map(process_url, urls))
+    # Fetch and extract URLs in parallel, handling each as soon as it is done
+    # so a slow URL doesn't hold back the rest. Each page is also appended to
+    # the progress file, which "update with hashtags" can resume from
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor, open(PROGRESS_FILE, 'wb') as progress:
+        futures = {executor.submit(fetch_and_extract, url): i for i, url in enumerate(urls)}
+        for future in as_completed(futures):
+            result = results[futures[future]] = future.result()
+            progress.write(orjson.dumps(result) + b"\n")
+            progress.flush()
+    
+    # Generate hashtags several documents at a time
+    generate_hashtags_batch(results)
+    save_hashtag_cache()
     
     # Write results to JSON
-    with open(JSON_OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2)
+    save_results(results)
+    os.remove(PROGRESS_FILE)
     
     print(f"Processed {len(results)} URLs. Results saved to {JSON_OUTPUT_FILE}")
 
 def update_json_with_hashtags():
     """Update existing JSON with hashtags"""
-    if not os.path.exists(JSON_OUTPUT_FILE):
+    if not (os.path.exists(JSON_OUTPUT_FILE) or os.path.exists(PROGRESS_FILE)):
         print(f"JSON file {JSON_OUTPUT_FILE} not found")
         return
     
     # Read existing JSON
-    with open(JSON_OUTPUT_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = []
+    if os.path.exists(JSON_OUTPUT_FILE):
+        try:
+            with open(JSON_OUTPUT_FILE, 'rb') as f:
+                data = orjson.loads(f.read())
+        except orjson.JSONDecodeError as e:
+            print(f"Error reading {JSON_OUTPUT_FILE}: {e}")
+            return
+    
+    # Fold in pages from an interrupted run, replacing older entries for the same URL
+    if os.path.exists(PROGRESS_FILE):
+        positions = {entry["url"]: i for i, entry in enumerate(data)}
+        for entry in load_progress():
+            if entry["url"] in positions:
+                data[positions[entry["url"]]] = entry
+            else:
+                positions[entry["url"]] = len(data)
+                data.append(entry)
     
     # Check if any entry is missing hashtags
     missing_hashtags = False
@@ -193,16 +411,17 @@ def update_json_with_hashtags():
         print("Hashtags already exist for all entries")
         return
     
-    # Generate hashtags for each entry
-    for entry in data:
-        if "hashtags" not in entry or not entry["hashtags"]:
-            hashtags = generate_hashtags(entry["title"], entry["body"])
-            entry["hashtags"] = hashtags
-            print(f"Generated hashtags for {entry['url']}: {hashtags}")
+    # Generate hashtags for each entry missing them
+    to_process = [entry for entry in data if not entry.get("hashtags")]
+    generate_hashtags_batch(to_process)
+    save_hashtag_cache()
+    for entry in to_process:
+        print(f"Generated hashtags for {entry['url']}: {entry['hashtags']}")
     
     # Save updated JSON
-    with open(JSON_OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
+    save_results(data)
+    if os.path.exists(PROGRESS_FILE):
+        os.remove(PROGRESS_FILE)
     
     print(f"Updated {JSON_OUTPUT_FILE} with hashtags")
 
@@ -210,9 +429,10 @@ if __name__ == "__main__":
     
     input_file = "extracted-urls-2025-06-13.txt"
     
-    # Check if JSON already exists
-    if os.path.exists(JSON_OUTPUT_FILE):
-        print(f"JSON file {JSON_OUTPUT_FILE} already exists.")
+    # Check if JSON already exists, or an earlier run was interrupted
+    existing = [path for path in (JSON_OUTPUT_FILE, PROGRESS_FILE) if os.path.exists(path)]
+    if existing:
+        print(f"Found existing results: {', '.join(existing)}")
         choice = input("Do you want to (1) process URLs again, (2) update with hashtags only, or (3) exit? ")
         
         if choice == "1":